@@ -1,27 +1,71 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
+import threading
+import hashlib
+import secrets
+import tempfile
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, g, abort
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from flask_caching import Cache
+from flask_session import Session
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+from sqlalchemy import event, inspect, lambda_stmt
+from sqlalchemy.orm import selectinload, raiseload, load_only, undefer, undefer_group, make_transient_to_detached
+from sqlalchemy.dialects.mysql import insert as mysql_insert, match
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.security import check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 from functools import wraps
-from datetime import datetime
 from dotenv import load_dotenv
 import click
+import orjson
+import redis
 
 # Load environment variables
 load_dotenv()
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson, which serializes straight to bytes"""
+    option = orjson.OPT_NON_STR_KEYS
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.option), mimetype=self.mimetype
+        )
+
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # Configuration
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', '9f3a8c7b6d2e5a1f0b3c9d4e7f8a6b2c')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_RECORD_QUERIES'] = False  # Skip per-query timing/bookkeeping
 app.config['SESSION_COOKIE_SECURE'] = os.getenv('FLASK_ENV') == 'production'
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hour
 
+# Behind a load balancer/reverse proxy, trust that many X-Forwarded-* hops so
+# remote_addr (which the rate limiter keys on) is the client, not the proxy.
+# Leave at 0 when clients connect directly, or the headers could be spoofed.
+trusted_proxies = int(os.getenv('TRUSTED_PROXIES', 0))
+if trusted_proxies:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxies, x_proto=trusted_proxies,
+                            x_host=trusted_proxies)
+
 # Database configuration - support both SQLite and MySQL
 db_type = os.getenv('DB_TYPE', 'sqlite')
 if db_type == 'mysql':
@@ -30,27 +74,133 @@ if db_type == 'mysql':
     db_host = os.getenv('DB_HOST', 'localhost')
     db_name = os.getenv('DB_NAME', 'freshbasket')
     app.config['SQLALCHEMY_DATABASE_URI'] = f'mysql+pymysql://{db_user}:{db_pass}@{db_host}/{db_name}'
+    # Reuse connections across requests; ping before use and recycle before
+    # MySQL's wait_timeout so workers never get a stale socket
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 20)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+    }
 else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///freshbasket.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLITE_DATABASE_URI', 'sqlite:///freshbasket.db')
+
+# Cache and session configuration - Redis when available,
+# in-process cache and signed-cookie sessions otherwise
+redis_url = os.getenv('REDIS_URL')
+if redis_url:
+    app.config['CACHE_TYPE'] = 'RedisCache'
+    app.config['CACHE_REDIS_URL'] = redis_url
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config['SESSION_REDIS'] = redis.from_url(redis_url)
+else:
+    app.config['CACHE_TYPE'] = 'SimpleCache'
+app.config['RATELIMIT_STORAGE_URI'] = redis_url or 'memory://'
+app.config['RATELIMIT_HEADERS_ENABLED'] = True  # Send Retry-After with 429s
+app.config['CACHE_DEFAULT_TIMEOUT'] = 300
+# Commit-time invalidation only reaches every worker through a shared Redis cache;
+# an in-process cache is per worker, so keep its product entries short-lived
+PRODUCT_CACHE_TIMEOUT = 3600 if redis_url else 300
 
 # Upload configuration
 app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads', 'products')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# Pagination
+PRODUCTS_PER_PAGE = 24
+ADMIN_PER_PAGE = 25
+
+# Search
+MIN_SEARCH_LENGTH = 3
 
 # Initialize extensions
 db = SQLAlchemy(app)
+cache = Cache(app)
+if redis_url:
+    Session(app)
+limiter = Limiter(get_remote_address, app=app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Please log in first.'
 
+# Password hashing - Argon2id; older Werkzeug (scrypt/pbkdf2) hashes are upgraded on login
+password_hasher = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=2)
+
+# Cap concurrent hashes so bursts of logins can't oversubscribe the CPU. Each hash
+# runs `parallelism` threads and the limit is per process, so share the cores between
+# the workers (WEB_CONCURRENCY, which gunicorn also reads as its worker count).
+# Requests over the cap wait in line; they still block their own worker thread.
+web_workers = int(os.getenv('WEB_CONCURRENCY', 1))
+password_hash_slots = threading.BoundedSemaphore(
+    max(1, (os.cpu_count() or 1) // (web_workers * password_hasher.parallelism))
+)
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL so readers don't block behind writers, and tune the page cache"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')  # Safe with WAL; fsyncs at checkpoints only
+    cursor.execute('PRAGMA cache_size=-64000')  # 64 MB
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA mmap_size=268435456')  # 256 MB
+    cursor.close()
+
+
+if db_type != 'mysql':
+    # Every pooled connection runs the pragmas when it is opened
+    with app.app_context():
+        event.listen(db.engine, 'connect', set_sqlite_pragmas)
+
+
 # Create upload directory if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+def strict_loading():
+    """Loader options that turn unplanned lazy loads into errors while debugging"""
+    return (raiseload('*'),) if app.debug else ()
+
+def verify_password_hash(password_hash, password):
+    """Verify a password against an Argon2 hash or a legacy Werkzeug hash"""
+    if not password_hash.startswith('$argon2'):
+        return check_password_hash(password_hash, password)
+    try:
+        return password_hasher.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def save_product_image(file):
+    """Stream an uploaded image to disk in chunks, named by its content hash"""
+    ext = file.filename.rsplit('.', 1)[1].lower()
+    hasher = hashlib.blake2b(digest_size=16)
+    fd, tmp_path = tempfile.mkstemp(dir=app.config['UPLOAD_FOLDER'])
+    try:
+        with os.fdopen(fd, 'wb') as dst:
+            while chunk := file.stream.read(UPLOAD_CHUNK_SIZE):
+                hasher.update(chunk)
+                dst.write(chunk)
+        
+        filename = f"{hasher.hexdigest()}.{ext}"
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        # Identical images are only stored once
+        if os.path.exists(filepath):
+            os.remove(tmp_path)
+        else:
+            # mkstemp creates the file 0600; make it readable by the web server like file.save() did
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, filepath)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return f"/static/uploads/products/{filename}"
+
 # Define models after db initialization
 class User(UserMixin, db.Model):
     """User model for customer accounts"""
@@ -62,20 +212,30 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     first_name = db.Column(db.String(100))
     last_name = db.Column(db.String(100))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # The ORM sends now() itself so rows also get timestamps on older tables that
+    # were created without a column DEFAULT
+    created_at = db.Column(db.DateTime, default=db.func.now(), server_default=db.func.now())
+    updated_at = db.Column(db.DateTime, default=db.func.now(), server_default=db.func.now(), onupdate=db.func.now())
     is_admin = db.Column(db.Boolean, default=False)
     
     # Relationships
-    orders = db.relationship('Order', backref='user', lazy=True, cascade='all, delete-orphan')
+    orders = db.relationship('Order', back_populates='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
         """Hash and set the user's password"""
-        self.password_hash = generate_password_hash(password)
+        with password_hash_slots:
+            self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
         """Verify the password against the hash"""
-        return check_password_hash(self.password_hash, password)
+        with password_hash_slots:
+            return verify_password_hash(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """Check whether the stored hash predates the current hashing parameters"""
+        if not self.password_hash.startswith('$argon2'):
+            return True
+        return password_hasher.check_needs_rehash(self.password_hash)
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -84,21 +244,29 @@ class User(UserMixin, db.Model):
 class Product(db.Model):
     """Product model for fruits and vegetables"""
     __tablename__ = 'products'
+    __table_args__ = (
+        # Full-text search index (MySQL only; SQLite falls back to LIKE)
+        db.Index('ft_products_name_description', 'name', 'description', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+        # Catalog filters are always is_available AND category: SQLite indexes only the
+        # live rows, MySQL has no partial indexes so it gets the composite instead
+        db.Index('ix_products_avail_cat', 'category', sqlite_where=db.text('is_available = 1')).ddl_if(dialect='sqlite'),
+        db.Index('ix_products_avail_cat', 'is_available', 'category').ddl_if(dialect='mysql'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, index=True)
-    description = db.Column(db.Text)
+    description = db.deferred(db.Column(db.Text))  # Loaded only by pages that show it
     category = db.Column(db.String(50), nullable=False, index=True)
-    price = db.Column(db.Float, nullable=False)
+    price = db.Column(db.Numeric(10, 2, asdecimal=False), nullable=False)
     stock = db.Column(db.Integer, default=0)
     image_url = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=db.func.now(), server_default=db.func.now())
+    updated_at = db.Column(db.DateTime, default=db.func.now(), server_default=db.func.now(), onupdate=db.func.now())
     is_available = db.Column(db.Boolean, default=True)
     
     # Relationships
-    cart_items = db.relationship('CartItem', backref='product', lazy=True, cascade='all, delete-orphan')
-    order_items = db.relationship('OrderItem', backref='product', lazy=True, cascade='delete')
+    cart_items = db.relationship('CartItem', back_populates='product', lazy=True, cascade='all, delete-orphan')
+    order_items = db.relationship('OrderItem', back_populates='product', lazy=True, cascade='delete')
     
     def __repr__(self):
         return f'<Product {self.name}>'
@@ -107,12 +275,19 @@ class Product(db.Model):
 class CartItem(db.Model):
     """Shopping cart items (session-based)"""
     __tablename__ = 'cart_items'
+    __table_args__ = (
+        # Serves per-session cart reads and backs the add-to-cart upsert
+        db.Index('ix_cart_session_product', 'session_id', 'product_id', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.String(255), nullable=False, index=True)
+    session_id = db.Column(db.String(255), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, default=1)
-    added_at = db.Column(db.DateTime, default=datetime.utcnow)
+    added_at = db.Column(db.DateTime, default=db.func.now(), server_default=db.func.now())
+    
+    # Cart rows are always shown with their product, so batch-load them
+    product = db.relationship('Product', back_populates='cart_items', lazy='selectin')
     
     def get_subtotal(self):
         """Calculate subtotal for this cart item"""
@@ -125,23 +300,32 @@ class CartItem(db.Model):
 class Order(db.Model):
     """Customer orders"""
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_user_date', 'user_id', 'order_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    order_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
-    total_amount = db.Column(db.Float, nullable=False)
+    order_date = db.Column(db.DateTime, default=db.func.now(), server_default=db.func.now(), index=True)
+    total_amount = db.Column(db.Numeric(10, 2, asdecimal=False), nullable=False)
     status = db.Column(db.String(50), default='pending')
-    shipping_address = db.Column(db.Text, nullable=False)
-    notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Only the order detail pages need these
+    shipping_address = db.deferred(db.Column(db.Text, nullable=False), group='detail')
+    notes = db.deferred(db.Column(db.Text), group='detail')
+    created_at = db.Column(db.DateTime, default=db.func.now(), server_default=db.func.now())
+    updated_at = db.Column(db.DateTime, default=db.func.now(), server_default=db.func.now(), onupdate=db.func.now())
     
     # Relationships
-    items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
+    user = db.relationship('User', back_populates='orders')
+    items = db.relationship('OrderItem', back_populates='order', lazy=True, cascade='all, delete-orphan')
     
     def calculate_total(self):
-        """Calculate total from order items"""
-        return sum(item.get_subtotal() for item in self.items)
+        """Calculate total from order items, with a single SUM query unless they're already loaded"""
+        if 'items' not in inspect(self).unloaded:
+            return sum(item.price * item.quantity for item in self.items)
+        return db.session.query(
+            db.func.coalesce(db.func.sum(OrderItem.subtotal), 0)
+        ).filter(OrderItem.order_id == self.id).scalar()
     
     def __repr__(self):
         return f'<Order {self.id} - {self.status}>'
@@ -150,12 +334,19 @@ class Order(db.Model):
 class OrderItem(db.Model):
     """Individual items in an order"""
     __tablename__ = 'order_items'
+    __table_args__ = (
+        db.Index('ix_order_items_order_subtotal', 'order_id', 'subtotal'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
-    price = db.Column(db.Float, nullable=False)
+    price = db.Column(db.Numeric(10, 2, asdecimal=False), nullable=False)
+    subtotal = db.Column(db.Numeric(12, 2, asdecimal=False), db.Computed('price * quantity', persisted=True))
+    
+    order = db.relationship('Order', back_populates='items')
+    product = db.relationship('Product', back_populates='order_items', lazy='selectin')
     
     def get_subtotal(self):
         """Calculate subtotal for this order item"""
@@ -165,10 +356,70 @@ class OrderItem(db.Model):
         return f'<OrderItem {self.product.name} x{self.quantity}>'
 
 
+def get_cached_row(model, ident, timeout=300, exclude=()):
+    """Load a row by primary key, serving repeat lookups from the cache"""
+    key = f'{model.__name__.lower()}:{ident}'
+    data = cache.get(key)
+    if data is None:
+        row = db.session.get(model, ident, options=[undefer('*')])
+        if row:
+            # Excluded columns stay out of the cache and are loaded on access
+            data = {c.key: getattr(row, c.key) for c in model.__table__.columns
+                    if c.key not in exclude}
+            cache.set(key, data, timeout=timeout)
+        return row
+    
+    # Rebuild the row and attach it to the session without a SELECT
+    row = model(**data)
+    make_transient_to_detached(row)
+    return db.session.merge(row, load=False)
+
+
+def invalidate_cached_row(model, ident):
+    """Drop a cached row after it changes"""
+    cache.delete(f'{model.__name__.lower()}:{ident}')
+
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_update')
+@event.listens_for(Product, 'after_delete')
+def track_product_change(mapper, connection, target):
+    """Remember changed products so their cache entries can be dropped on commit"""
+    db.session.info.setdefault('changed_products', set()).add(target.id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_changed_products(session):
+    """Drop cache entries for products changed in the committed transaction"""
+    changed_products = session.info.pop('changed_products', None)
+    if changed_products:
+        for product_id in changed_products:
+            invalidate_cached_row(Product, product_id)
+        invalidate_product_listings()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_changed_products(session):
+    """Forget product changes that were rolled back"""
+    session.info.pop('changed_products', None)
+
+
 @login_manager.user_loader
 def load_user(user_id):
     """Load user from database by ID"""
-    return User.query.get(int(user_id))
+    return get_cached_row(User, int(user_id), timeout=60, exclude=('password_hash',))
+
+
+# The columns product cards render
+PRODUCT_CARD_COLUMNS = (
+    Product.id, Product.name, Product.category, Product.description,
+    Product.price, Product.stock, Product.image_url
+)
+
+
+def product_card_select():
+    """Select only the product card columns, as plain rows instead of ORM objects"""
+    return db.select(*PRODUCT_CARD_COLUMNS)
 
 
 # ==================== Authentication Routes ====================
@@ -176,7 +427,9 @@ def load_user(user_id):
 @app.route('/')
 def home():
     """Home page - display featured products"""
-    featured_products = Product.query.filter_by(is_available=True).limit(6).all()
+    featured_products = db.session.execute(lambda_stmt(
+        lambda: product_card_select().where(Product.is_available == True).limit(6)
+    )).all()
     return render_template('index.html', featured_products=featured_products)
 
 
@@ -230,6 +483,7 @@ def register():
 
 
 @app.route('/login', methods=['GET', 'POST'])
+@limiter.limit('5 per minute', methods=['POST'])
 def login():
     """User login"""
     if request.method == 'POST':
@@ -239,7 +493,11 @@ def login():
         user = User.query.filter_by(username=username).first()
         
         if user and user.check_password(password):
+            if user.password_needs_rehash():
+                user.set_password(password)
+                db.session.commit()
             login_user(user, remember=request.form.get('remember_me'))
+            merge_anonymous_cart()
             flash(f'Welcome back, {user.first_name or user.username}!', 'success')
             return redirect(url_for('home'))
         else:
@@ -259,27 +517,62 @@ def logout():
 
 # ==================== Product Routes ====================
 
+@cache.cached(key_prefix='product_categories')
+def get_categories():
+    """Get the distinct product categories (cached)"""
+    return [c[0] for c in db.session.query(Product.category).distinct().all()]
+
+
+@cache.memoize(timeout=60)
+def search_product_ids(category, search):
+    """Get the IDs of available products matching a search term (cached)"""
+    query = Product.query.with_entities(Product.id).filter_by(is_available=True)
+    
+    if category != 'all':
+        query = query.filter_by(category=category)
+    
+    if db.engine.dialect.name == 'mysql':
+        query = query.filter(match(Product.name, Product.description, against=search))
+    else:
+        # Treat % and _ in the search term literally
+        pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        query = query.filter(Product.name.ilike(pattern, escape='\\') | 
+                             Product.description.ilike(pattern, escape='\\'))
+    
+    return [row.id for row in query.all()]
+
+
+def invalidate_product_listings():
+    """Drop the cached categories and search results after a product change"""
+    cache.delete('product_categories')
+    cache.delete_memoized(search_product_ids)
+
+
 @app.route('/products')
 def products():
     """Browse all products"""
     category = request.args.get('category', 'all')
-    search = request.args.get('search', '')
+    search = request.args.get('search', '').strip()
+    page = request.args.get('page', 1, type=int)
     
-    query = Product.query.filter_by(is_available=True)
-    
-    if category != 'all':
-        query = query.filter_by(category=category)
+    if search and len(search) < MIN_SEARCH_LENGTH:
+        flash(f'Search terms must be at least {MIN_SEARCH_LENGTH} characters.', 'error')
+        search = ''
     
+    stmt = db.select(Product).options(load_only(*PRODUCT_CARD_COLUMNS), *strict_loading())
     if search:
-        query = query.filter(Product.name.ilike(f'%{search}%') | 
-                             Product.description.ilike(f'%{search}%'))
+        stmt = stmt.where(Product.id.in_(search_product_ids(category, search.lower())))
+    else:
+        stmt = stmt.where(Product.is_available == True)
+        if category != 'all':
+            stmt = stmt.where(Product.category == category)
     
-    all_products = query.all()
-    categories = db.session.query(Product.category).distinct().all()
+    pagination = db.paginate(stmt.order_by(Product.id), page=page, per_page=PRODUCTS_PER_PAGE, error_out=False)
     
     return render_template('products.html', 
-                          products=all_products, 
-                          categories=[c[0] for c in categories],
+                          products=pagination.items, 
+                          pagination=pagination,
+                          categories=get_categories(),
                           selected_category=category,
                           search_term=search)
 
@@ -287,8 +580,11 @@ def products():
 @app.route('/product/<int:product_id>')
 def product_detail(product_id):
     """Product detail page"""
-    product = Product.query.get_or_404(product_id)
-    related_products = Product.query.filter_by(
+    product = get_cached_row(Product, product_id, timeout=PRODUCT_CACHE_TIMEOUT) or abort(404)
+    # Related cards only show name, price, image and category
+    related_products = Product.query.options(
+        load_only(Product.name, Product.price, Product.image_url, Product.category)
+    ).filter_by(
         category=product.category,
         is_available=True
     ).filter(Product.id != product_id).limit(4).all()
@@ -301,24 +597,84 @@ def product_detail(product_id):
 # ==================== Cart Routes ====================
 
 def get_session_id():
-    """Get or create session ID for anonymous carts"""
+    """Get the cart key: the user's account when logged in, else an anonymous session ID"""
+    if current_user.is_authenticated:
+        return f'u:{current_user.id}'
     if 'cart_session' not in session:
-        session['cart_session'] = os.urandom(16).hex()
+        session['cart_session'] = secrets.token_hex(16)
         session.permanent = True
     return session['cart_session']
 
 
+def merge_anonymous_cart():
+    """Move the anonymous session cart into the logged-in user's cart"""
+    anonymous_id = session.pop('cart_session', None)
+    if not anonymous_id:
+        return
+    
+    anonymous_items = CartItem.query.filter_by(session_id=anonymous_id).all()
+    for item in anonymous_items:
+        upsert_cart_item(get_session_id(), item.product_id, item.quantity)
+    CartItem.query.filter_by(session_id=anonymous_id).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def get_cart_totals():
+    """Return (total, item_count) for the current cart in one aggregate query"""
+    if 'cart_totals' not in g:
+        session_id = get_session_id()
+        # Runs on nearly every page, so build the statement once and reuse it
+        total, item_count = db.session.execute(lambda_stmt(lambda: db.select(
+            db.func.coalesce(db.func.sum(Product.price * CartItem.quantity), 0),
+            db.func.coalesce(db.func.sum(CartItem.quantity), 0)
+        ).join(Product, Product.id == CartItem.product_id).where(
+            CartItem.session_id == session_id
+        ))).one()
+        g.cart_totals = (total, item_count)
+    return g.cart_totals
+
+
+def sum_cart_items(cart_items):
+    """Total cart rows that are already loaded, sharing the result with the navbar badge"""
+    g.cart_totals = (
+        sum(item.get_subtotal() for item in cart_items),
+        sum(item.quantity for item in cart_items)
+    )
+    return g.cart_totals
+
+
+@app.context_processor
+def inject_cart_count():
+    """Expose the cart item count to the navbar badge"""
+    if not current_user.is_authenticated and 'cart_session' not in session:
+        return {'cart_count': 0}
+    return {'cart_count': get_cart_totals()[1]}
+
+
+def upsert_cart_item(session_id, product_id, quantity):
+    """Add a product to a cart, or bump its quantity, in one atomic statement"""
+    if db.engine.dialect.name == 'mysql':
+        stmt = mysql_insert(CartItem).values(session_id=session_id, product_id=product_id, quantity=quantity)
+        stmt = stmt.on_duplicate_key_update(quantity=CartItem.quantity + stmt.inserted.quantity)
+    else:
+        stmt = sqlite_insert(CartItem).values(session_id=session_id, product_id=product_id, quantity=quantity)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['session_id', 'product_id'],
+            set_={'quantity': CartItem.quantity + stmt.excluded.quantity}
+        )
+    db.session.execute(stmt)
+
+
 @app.route('/cart')
 def view_cart():
     """View shopping cart"""
-    if current_user.is_authenticated:
-        # For logged-in users, fetch from database if needed
-        cart_items = CartItem.query.filter_by(session_id=get_session_id()).all()
-    else:
-        cart_items = CartItem.query.filter_by(session_id=get_session_id()).all()
-    
-    total = sum(item.get_subtotal() for item in cart_items)
-    item_count = sum(item.quantity for item in cart_items)
+    session_id = get_session_id()
+    loader_options = (selectinload(CartItem.product), *strict_loading())
+    # Load products alongside the cart rows so subtotals don't query per item
+    cart_items = db.session.execute(lambda_stmt(
+        lambda: db.select(CartItem).where(CartItem.session_id == session_id).options(*loader_options)
+    )).scalars().all()
+    total, item_count = sum_cart_items(cart_items)
     
     return render_template('cart.html', 
                           cart_items=cart_items, 
@@ -327,9 +683,10 @@ def view_cart():
 
 
 @app.route('/cart/add/<int:product_id>', methods=['POST'])
+@limiter.limit('30 per minute')
 def add_to_cart(product_id):
     """Add product to cart"""
-    product = Product.query.get_or_404(product_id)
+    product = get_cached_row(Product, product_id, timeout=PRODUCT_CACHE_TIMEOUT) or abort(404)
     quantity = request.form.get('quantity', 1, type=int)
     
     if quantity < 1:
@@ -339,25 +696,12 @@ def add_to_cart(product_id):
         flash('Not enough stock available.', 'error')
         return redirect(url_for('product_detail', product_id=product_id))
     
-    session_id = get_session_id()
-    cart_item = CartItem.query.filter_by(
-        session_id=session_id,
-        product_id=product_id
-    ).first()
-    
+    # Read before the commit expires the cached instance and forces a reload
+    product_name = product.name
     try:
-        if cart_item:
-            cart_item.quantity += quantity
-        else:
-            cart_item = CartItem(
-                session_id=session_id,
-                product_id=product_id,
-                quantity=quantity
-            )
-            db.session.add(cart_item)
-        
+        upsert_cart_item(get_session_id(), product_id, quantity)
         db.session.commit()
-        flash(f'{product.name} added to cart!', 'success')
+        flash(f'{product_name} added to cart!', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Failed to add to cart: {str(e)}', 'error')
@@ -409,10 +753,13 @@ def remove_from_cart(cart_item_id):
 # ==================== Order Routes ====================
 
 @app.route('/checkout', methods=['GET', 'POST'])
+@limiter.limit('10 per minute', methods=['POST'])
 @login_required
 def checkout():
     """Checkout and place order"""
-    cart_items = CartItem.query.filter_by(session_id=get_session_id()).all()
+    cart_items = CartItem.query.options(selectinload(CartItem.product), *strict_loading()).filter_by(
+        session_id=get_session_id()
+    ).all()
     
     if not cart_items:
         flash('Your cart is empty.', 'error')
@@ -427,30 +774,37 @@ def checkout():
             return redirect(url_for('checkout'))
         
         try:
-            # Create order
-            total_amount = sum(item.get_subtotal() for item in cart_items)
+            # Create order; the total is filled in from its items below
             order = Order(
                 user_id=current_user.id,
                 shipping_address=shipping_address,
                 notes=notes,
-                total_amount=total_amount
+                total_amount=0
             )
-            
-            # Add order items
-            for cart_item in cart_items:
-                order_item = OrderItem(
-                    product_id=cart_item.product_id,
-                    quantity=cart_item.quantity,
-                    price=cart_item.product.price
-                )
-                order.items.append(order_item)
-            
             db.session.add(order)
             db.session.flush()
             
-            # Clear cart
-            for item in cart_items:
-                db.session.delete(item)
+            # Add order items in one batched INSERT
+            db.session.execute(db.insert(OrderItem), [
+                {
+                    'order_id': order.id,
+                    'product_id': cart_item.product_id,
+                    'quantity': cart_item.quantity,
+                    'price': cart_item.product.price
+                }
+                for cart_item in cart_items
+            ])
+            
+            # Set the stored total from the inserted items in one UPDATE
+            db.session.execute(
+                db.update(Order).where(Order.id == order.id).values(
+                    total_amount=db.select(db.func.sum(OrderItem.subtotal))
+                    .where(OrderItem.order_id == order.id).scalar_subquery()
+                )
+            )
+            
+            # Clear cart with a single DELETE
+            CartItem.query.filter_by(session_id=get_session_id()).delete(synchronize_session=False)
             
             db.session.commit()
             flash('Order placed successfully!', 'success')
@@ -461,7 +815,7 @@ def checkout():
             flash(f'Failed to place order: {str(e)}', 'error')
             return redirect(url_for('checkout'))
     
-    total = sum(item.get_subtotal() for item in cart_items)
+    total, _ = sum_cart_items(cart_items)
     return render_template('checkout.html', cart_items=cart_items, total=total)
 
 
@@ -469,7 +823,11 @@ def checkout():
 @login_required
 def order_confirmation(order_id):
     """Order confirmation page"""
-    order = Order.query.get_or_404(order_id)
+    order = Order.query.options(
+        undefer_group('detail'),
+        selectinload(Order.items).selectinload(OrderItem.product).load_only(Product.name),
+        *strict_loading()
+    ).get_or_404(order_id)
     
     # Check authorization
     if order.user_id != current_user.id:
@@ -483,7 +841,11 @@ def order_confirmation(order_id):
 @login_required
 def user_orders():
     """View user's orders"""
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.order_date.desc()).all()
+    # Three queries however many orders: orders, all their items, then their products
+    orders = Order.query.options(
+        selectinload(Order.items).selectinload(OrderItem.product).load_only(Product.name),
+        *strict_loading()
+    ).filter_by(user_id=current_user.id).order_by(Order.order_date.desc()).all()
     return render_template('orders.html', orders=orders)
 
 
@@ -508,17 +870,18 @@ def admin_required(f):
 @admin_required
 def admin_dashboard():
     """Admin dashboard with statistics"""
-    total_users = User.query.count()
-    total_products = Product.query.count()
-    total_orders = Order.query.count()
-    pending_orders = Order.query.filter_by(status='pending').count()
-    
-    recent_orders = Order.query.order_by(Order.order_date.desc()).limit(10).all()
+    # Fetch all counters and revenue in a single round-trip
+    total_users, total_products, total_orders, pending_orders, total_revenue = db.session.query(
+        db.session.query(db.func.count(User.id)).scalar_subquery(),
+        db.session.query(db.func.count(Product.id)).scalar_subquery(),
+        db.session.query(db.func.count(Order.id)).scalar_subquery(),
+        db.session.query(db.func.count(Order.id)).filter(Order.status == 'pending').scalar_subquery(),
+        db.session.query(db.func.coalesce(db.func.sum(Order.total_amount), 0)).scalar_subquery()
+    ).one()
+    
+    recent_orders = Order.query.options(selectinload(Order.user), *strict_loading()).order_by(Order.order_date.desc()).limit(10).all()
     low_stock_products = Product.query.filter(Product.stock < 10).all()
     
-    # Calculate revenue
-    total_revenue = db.session.query(db.func.sum(Order.total_amount)).scalar() or 0
-    
     return render_template('admin/dashboard.html',
                           total_users=total_users,
                           total_products=total_products,
@@ -534,8 +897,9 @@ def admin_dashboard():
 @admin_required
 def admin_products():
     """Admin: view all products"""
-    products = Product.query.all()
-    return render_template('admin/products.html', products=products)
+    page = request.args.get('page', 1, type=int)
+    pagination = Product.query.order_by(Product.id).paginate(page=page, per_page=ADMIN_PER_PAGE, error_out=False)
+    return render_template('admin/products.html', products=pagination.items, pagination=pagination)
 
 
 @app.route('/admin/products/add', methods=['GET', 'POST'])
@@ -560,14 +924,8 @@ def admin_add_product():
             file = request.files['image_file']
             if file and file.filename:
                 if allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    # Add timestamp to make filename unique
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    filename = f"{timestamp}_{filename}"
-                    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
                     try:
-                        file.save(filepath)
-                        image_url = f"/static/uploads/products/{filename}"
+                        image_url = save_product_image(file)
                     except Exception as e:
                         flash(f'Error uploading file: {str(e)}', 'error')
                 else:
@@ -603,7 +961,7 @@ def admin_add_product():
 @admin_required
 def admin_edit_product(product_id):
     """Admin: edit product"""
-    product = Product.query.get_or_404(product_id)
+    product = Product.query.options(undefer(Product.description)).get_or_404(product_id)
     
     if request.method == 'POST':
         product.name = request.form.get('name')
@@ -619,14 +977,8 @@ def admin_edit_product(product_id):
             file = request.files['image_file']
             if file and file.filename:
                 if allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    # Add timestamp to make filename unique
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    filename = f"{timestamp}_{filename}"
-                    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
                     try:
-                        file.save(filepath)
-                        product.image_url = f"/static/uploads/products/{filename}"
+                        product.image_url = save_product_image(file)
                         file_uploaded = True
                     except Exception as e:
                         flash(f'Error uploading file: {str(e)}', 'error')
@@ -675,13 +1027,22 @@ def admin_delete_product(product_id):
 def admin_orders():
     """Admin: view all orders"""
     status_filter = request.args.get('status', 'all')
-    
-    query = Order.query
+    page = request.args.get('page', 1, type=int)
+    
+    # The list only counts items, so skip loading their products
+    query = Order.query.options(
+        selectinload(Order.user),
+        selectinload(Order.items).lazyload(OrderItem.product),
+        *strict_loading()
+    )
     if status_filter != 'all':
         query = query.filter_by(status=status_filter)
     
-    orders = query.order_by(Order.order_date.desc()).all()
-    return render_template('admin/orders.html', orders=orders, status_filter=status_filter)
+    pagination = query.order_by(Order.order_date.desc()).paginate(page=page, per_page=ADMIN_PER_PAGE, error_out=False)
+    return render_template('admin/orders.html',
+                          orders=pagination.items,
+                          pagination=pagination,
+                          status_filter=status_filter)
 
 
 @app.route('/admin/orders/<int:order_id>')
@@ -689,7 +1050,12 @@ def admin_orders():
 @admin_required
 def admin_order_detail(order_id):
     """Admin: view order details"""
-    order = Order.query.get_or_404(order_id)
+    order = Order.query.options(
+        undefer_group('detail'),
+        selectinload(Order.user),
+        selectinload(Order.items).selectinload(OrderItem.product),
+        *strict_loading()
+    ).get_or_404(order_id)
     return render_template('admin/order_detail.html', order=order)
 
 
@@ -720,8 +1086,11 @@ def admin_update_order_status(order_id):
 @admin_required
 def admin_users():
     """Admin: view all users"""
-    users = User.query.order_by(User.created_at.desc()).all()
-    return render_template('admin/users.html', users=users)
+    page = request.args.get('page', 1, type=int)
+    pagination = User.query.options(selectinload(User.orders), *strict_loading()).order_by(User.created_at.desc()).paginate(
+        page=page, per_page=ADMIN_PER_PAGE, error_out=False
+    )
+    return render_template('admin/users.html', users=pagination.items, pagination=pagination)
 
 
 @app.route('/admin/users/<int:user_id>/toggle-admin', methods=['POST'])
@@ -738,6 +1107,7 @@ def admin_toggle_admin(user_id):
     
     try:
         db.session.commit()
+        invalidate_cached_row(User, user_id)
         status = 'admin' if user.is_admin else 'regular user'
         flash(f'{user.username} is now a {status}!', 'success')
     except Exception as e:
@@ -755,6 +1125,15 @@ def not_found_error(error):
     return render_template('404.html'), 404
 
 
+@app.errorhandler(429)
+def ratelimit_error(error):
+    """Handle rate-limited requests, keeping the 429 status and Retry-After header"""
+    if request.endpoint == 'login':
+        flash('Too many attempts. Please wait a minute and try again.', 'error')
+        return render_template('login.html'), 429
+    return render_template('429.html'), 429
+
+
 @app.errorhandler(500)
 def internal_error(error):
     """Handle 500 errors"""
@@ -771,6 +1150,74 @@ def init_db():
     print('Database initialized.')
 
 
+@app.cli.command()
+def upgrade_db():
+    """Bring a database created by an earlier version up to the current schema"""
+    inspector = inspect(db.engine)
+    dialect = db.engine.dialect.name
+    cart_items = CartItem.__table__
+    
+    with db.engine.begin() as conn:
+        # Money columns move from FLOAT to exact decimals (SQLite columns are untyped)
+        if dialect == 'mysql':
+            for table, column in ((Product.__table__, 'price'), (Order.__table__, 'total_amount'),
+                                  (OrderItem.__table__, 'price')):
+                current = {c['name']: c['type'] for c in inspector.get_columns(table.name)}
+                if isinstance(current[column], db.Float):
+                    conn.execute(db.text(
+                        f'ALTER TABLE {table.name} MODIFY {column} DECIMAL(10, 2) NOT NULL'
+                    ))
+                    print(f'Converted {table.name}.{column} to DECIMAL(10, 2).')
+        
+        # Stored line subtotals; SQLite can only add a generated column as VIRTUAL
+        if 'subtotal' not in {c['name'] for c in inspector.get_columns('order_items')}:
+            if dialect == 'mysql':
+                ddl = 'ALTER TABLE order_items ADD COLUMN subtotal DECIMAL(12, 2) AS (price * quantity) STORED'
+            else:
+                ddl = ('ALTER TABLE order_items ADD COLUMN subtotal NUMERIC(12, 2) '
+                       'GENERATED ALWAYS AS (price * quantity) VIRTUAL')
+            conn.execute(db.text(ddl))
+            print('Added order_items.subtotal.')
+        
+        # Carts may hold a product twice from before the unique index; fold them into one row
+        existing_indexes = {table.name: {i['name'] for i in inspector.get_indexes(table.name)}
+                            for table in db.metadata.sorted_tables}
+        if 'ix_cart_session_product' not in existing_indexes['cart_items']:
+            duplicates = conn.execute(
+                db.select(cart_items.c.session_id, cart_items.c.product_id,
+                          db.func.min(cart_items.c.id), db.func.sum(cart_items.c.quantity))
+                .group_by(cart_items.c.session_id, cart_items.c.product_id)
+                .having(db.func.count() > 1)
+            ).all()
+            for session_id, product_id, keep_id, quantity in duplicates:
+                conn.execute(db.update(cart_items).where(cart_items.c.id == keep_id)
+                             .values(quantity=quantity))
+                conn.execute(db.delete(cart_items).where(
+                    cart_items.c.session_id == session_id,
+                    cart_items.c.product_id == product_id,
+                    cart_items.c.id != keep_id
+                ))
+        
+        # Dialect-specific indexes (ddl_if) are skipped by create() on other databases
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name not in existing_indexes[table.name]:
+                    index.create(conn)
+        upgraded = inspect(conn)
+        for table in db.metadata.sorted_tables:
+            for name in sorted({i['name'] for i in upgraded.get_indexes(table.name)}
+                               - existing_indexes[table.name]):
+                print(f'Created index {name}.')
+        
+        # Superseded by ix_cart_session_product, which leads with session_id
+        if 'ix_cart_items_session_id' in existing_indexes['cart_items']:
+            conn.execute(db.text('DROP INDEX ix_cart_items_session_id' +
+                                 (' ON cart_items' if dialect == 'mysql' else '')))
+            print('Dropped index ix_cart_items_session_id.')
+    
+    print('Database upgraded.')
+
+
 @app.cli.command()
 def seed_db():
     """Seed database with sample products"""
@@ -780,7 +1227,7 @@ def seed_db():
         return
     
     sample_products = [
-        Product(
+        dict(
             name='Red Apples',
             category='fruit',
             price=5.99,
@@ -789,7 +1236,7 @@ def seed_db():
             image_url='/static/images/apple.jpg',
             is_available=True
         ),
-        Product(
+        dict(
             name='Bananas',
             category='fruit',
             price=3.99,
@@ -798,7 +1245,7 @@ def seed_db():
             image_url='/static/images/banana.jpg',
             is_available=True
         ),
-        Product(
+        dict(
             name='Carrots',
             category='vegetable',
             price=4.99,
@@ -807,7 +1254,7 @@ def seed_db():
             image_url='/static/images/carrot.jpg',
             is_available=True
         ),
-        Product(
+        dict(
             name='Tomatoes',
             category='vegetable',
             price=6.99,
@@ -816,7 +1263,7 @@ def seed_db():
             image_url='/static/images/tomato.jpg',
             is_available=True
         ),
-        Product(
+        dict(
             name='Strawberries',
             category='fruit',
             price=7.99,
@@ -825,7 +1272,7 @@ def seed_db():
             image_url='/static/images/strawberry.jpg',
             is_available=True
         ),
-        Product(
+        dict(
             name='Lettuce',
             category='vegetable',
             price=3.49,
@@ -836,10 +1283,11 @@ def seed_db():
         ),
     ]
     
-    for product in sample_products:
-        db.session.add(product)
-    
+    # One multi-row INSERT instead of a unit-of-work pass per product
+    db.session.execute(db.insert(Product), sample_products)
     db.session.commit()
+    # Bulk inserts skip the per-object events that normally invalidate caches
+    invalidate_product_listings()
     print('Database seeded with sample products.')
 
 
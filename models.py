@@ -1,6 +1,6 @@
-from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy import inspect
 
 # This will be set by app.py during initialization
 db = None
@@ -23,21 +23,29 @@ class User(UserMixin):
 class Product(db.Model):
     """Product model for fruits and vegetables"""
     __tablename__ = 'products'
+    __table_args__ = (
+        # Full-text search index (MySQL only; SQLite falls back to LIKE)
+        db.Index('ft_products_name_description', 'name', 'description', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+        # Catalog filters are always is_available AND category: SQLite indexes only the
+        # live rows, MySQL has no partial indexes so it gets the composite instead
+        db.Index('ix_products_avail_cat', 'category', sqlite_where=db.text('is_available = 1')).ddl_if(dialect='sqlite'),
+        db.Index('ix_products_avail_cat', 'is_available', 'category').ddl_if(dialect='mysql'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, index=True)
-    description = db.Column(db.Text)
+    description = db.deferred(db.Column(db.Text))  # Loaded only by pages that show it
     category = db.Column(db.String(50), nullable=False, index=True)  # 'fruit' or 'vegetable'
-    price = db.Column(db.Float, nullable=False)
+    price = db.Column(db.Numeric(10, 2, asdecimal=False), nullable=False)
     stock = db.Column(db.Integer, default=0)
     image_url = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=db.func.now(), server_default=db.func.now())
+    updated_at = db.Column(db.DateTime, default=db.func.now(), server_default=db.func.now(), onupdate=db.func.now())
     is_available = db.Column(db.Boolean, default=True)
     
     # Relationships
-    cart_items = db.relationship('CartItem', backref='product', lazy=True, cascade='all, delete-orphan')
-    order_items = db.relationship('OrderItem', backref='product', lazy=True, cascade='delete')
+    cart_items = db.relationship('CartItem', back_populates='product', lazy=True, cascade='all, delete-orphan')
+    order_items = db.relationship('OrderItem', back_populates='product', lazy=True, cascade='delete')
     
     def __repr__(self):
         return f'<Product {self.name}>'
@@ -46,12 +54,19 @@ class Product(db.Model):
 class CartItem(db.Model):
     """Shopping cart items (session-based)"""
     __tablename__ = 'cart_items'
+    __table_args__ = (
+        # Serves per-session cart reads and backs the add-to-cart upsert
+        db.Index('ix_cart_session_product', 'session_id', 'product_id', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.String(255), nullable=False, index=True)
+    session_id = db.Column(db.String(255), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, default=1)
-    added_at = db.Column(db.DateTime, default=datetime.utcnow)
+    added_at = db.Column(db.DateTime, default=db.func.now(), server_default=db.func.now())
+    
+    # Cart rows are always shown with their product, so batch-load them
+    product = db.relationship('Product', back_populates='cart_items', lazy='selectin')
     
     def get_subtotal(self):
         """Calculate subtotal for this cart item"""
@@ -64,23 +79,31 @@ class CartItem(db.Model):
 class Order(db.Model):
     """Customer orders"""
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_user_date', 'user_id', 'order_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    order_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
-    total_amount = db.Column(db.Float, nullable=False)
+    order_date = db.Column(db.DateTime, default=db.func.now(), server_default=db.func.now(), index=True)
+    total_amount = db.Column(db.Numeric(10, 2, asdecimal=False), nullable=False)
     status = db.Column(db.String(50), default='pending')  # pending, processing, shipped, delivered, cancelled
-    shipping_address = db.Column(db.Text, nullable=False)
-    notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Only the order detail pages need these
+    shipping_address = db.deferred(db.Column(db.Text, nullable=False), group='detail')
+    notes = db.deferred(db.Column(db.Text), group='detail')
+    created_at = db.Column(db.DateTime, default=db.func.now(), server_default=db.func.now())
+    updated_at = db.Column(db.DateTime, default=db.func.now(), server_default=db.func.now(), onupdate=db.func.now())
     
     # Relationships
-    items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
+    items = db.relationship('OrderItem', back_populates='order', lazy=True, cascade='all, delete-orphan')
     
     def calculate_total(self):
-        """Calculate total from order items"""
-        return sum(item.get_subtotal() for item in self.items)
+        """Calculate total from order items, with a single SUM query unless they're already loaded"""
+        if 'items' not in inspect(self).unloaded:
+            return sum(item.price * item.quantity for item in self.items)
+        return db.session.query(
+            db.func.coalesce(db.func.sum(OrderItem.subtotal), 0)
+        ).filter(OrderItem.order_id == self.id).scalar()
     
     def __repr__(self):
         return f'<Order {self.id} - {self.status}>'
@@ -89,12 +112,19 @@ class Order(db.Model):
 class OrderItem(db.Model):
     """Individual items in an order"""
     __tablename__ = 'order_items'
+    __table_args__ = (
+        db.Index('ix_order_items_order_subtotal', 'order_id', 'subtotal'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
-    price = db.Column(db.Float, nullable=False)  # Price at time of order
+    price = db.Column(db.Numeric(10, 2, asdecimal=False), nullable=False)  # Price at time of order
+    subtotal = db.Column(db.Numeric(12, 2, asdecimal=False), db.Computed('price * quantity', persisted=True))
+    
+    order = db.relationship('Order', back_populates='items')
+    product = db.relationship('Product', back_populates='order_items', lazy='selectin')
     
     def get_subtotal(self):
         """Calculate subtotal for this order item"""
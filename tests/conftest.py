@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+
+# Point the app at a throwaway SQLite database and the in-process cache
+# before it is imported; load_dotenv() won't override these
+_db_dir = tempfile.mkdtemp(prefix='freshbasket-tests-')
+os.environ['DB_TYPE'] = 'sqlite'
+os.environ['SQLITE_DATABASE_URI'] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ['REDIS_URL'] = ''
+os.environ['TRUSTED_PROXIES'] = '0'
+
+from sqlalchemy import event
+
+from app import app as flask_app, db, cache, limiter, User, Product
+
+
+@pytest.fixture(autouse=True)
+def app():
+    """Fresh tables, cache and rate-limit counters for every test.
+
+    No app context is left pushed, so each test request gets its own
+    session and identity map, as it would in production.
+    """
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        cache.clear()
+        limiter.reset()
+    return flask_app
+
+
+def pytest_sessionfinish(session, exitstatus):
+    with flask_app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(_db_dir, ignore_errors=True)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@contextmanager
+def count_queries():
+    """Collect every SQL statement sent to the database inside the block"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with flask_app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+@pytest.fixture
+def products(app):
+    """IDs of six available products across both categories"""
+    with app.app_context():
+        rows = [
+            Product(name=f'{category.title()} {n}', category=category, description=f'Fresh {category}',
+                    price=1.50 + n, stock=50, is_available=True)
+            for category in ('fruit', 'vegetable')
+            for n in range(3)
+        ]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [row.id for row in rows]
+
+
+def make_user(username='alice', password='secret123', is_admin=False):
+    with flask_app.app_context():
+        user = User(username=username, email=f'{username}@example.com', is_admin=is_admin)
+        user.set_password(password)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def login(client, username='alice', password='secret123'):
+    return client.post('/login', data={'username': username, 'password': password})
@@ -0,0 +1,53 @@
+from conftest import count_queries, make_user, login
+from app import db, Product, get_cached_row
+
+
+def test_cached_row_skips_the_select(app, products):
+    with app.app_context():
+        assert get_cached_row(Product, products[0]).name == 'Fruit 0'
+
+    with app.app_context(), count_queries() as queries:
+        product = get_cached_row(Product, products[0])
+        assert (product.name, product.description, product.price) == ('Fruit 0', 'Fresh fruit', 1.50)
+    assert queries == []
+
+
+def test_cached_row_is_dropped_after_commit(app, products):
+    with app.app_context():
+        get_cached_row(Product, products[0])
+
+    with app.app_context():
+        db.session.get(Product, products[0]).price = 9.99
+        db.session.commit()
+
+    with app.app_context():
+        assert get_cached_row(Product, products[0]).price == 9.99
+
+
+def test_rolled_back_changes_keep_the_cache(app, products):
+    with app.app_context():
+        get_cached_row(Product, products[0])
+
+    with app.app_context():
+        db.session.get(Product, products[0]).price = 9.99
+        db.session.flush()
+        db.session.rollback()
+
+    with app.app_context(), count_queries() as queries:
+        assert get_cached_row(Product, products[0]).price == 1.50
+    assert queries == []
+
+
+def test_admin_edit_refreshes_product_and_listings(client, products):
+    make_user('admin', is_admin=True)
+    login(client, 'admin')
+    client.get(f'/product/{products[0]}')
+    client.get('/products?search=Fruit')
+
+    client.post(f'/admin/products/edit/{products[0]}', data={
+        'name': 'Golden Apple', 'description': 'Crisp', 'category': 'fruit',
+        'price': '4.25', 'stock': '10', 'is_available': 'on',
+    })
+
+    assert 'Golden Apple' in client.get(f'/product/{products[0]}').get_data(as_text=True)
+    assert 'Golden Apple' in client.get('/products?search=Golden').get_data(as_text=True)
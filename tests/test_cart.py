@@ -0,0 +1,49 @@
+from conftest import make_user, login
+from app import db, CartItem
+
+
+def cart_rows(app):
+    with app.app_context():
+        return {(item.session_id, item.product_id): item.quantity for item in CartItem.query.all()}
+
+
+def test_adding_a_product_twice_bumps_its_quantity(app, client, products):
+    client.post(f'/cart/add/{products[0]}', data={'quantity': 2})
+    client.post(f'/cart/add/{products[0]}', data={'quantity': 3})
+
+    rows = cart_rows(app)
+    assert len(rows) == 1
+    assert list(rows.values()) == [5]
+
+
+def test_add_to_cart_rejects_more_than_stock(app, client, products):
+    client.post(f'/cart/add/{products[0]}', data={'quantity': 51})
+    assert cart_rows(app) == {}
+
+
+def test_anonymous_cart_is_merged_on_login(app, client, products):
+    user_id = make_user()
+    with client.session_transaction() as session:
+        session['cart_session'] = 'anon'
+    client.post(f'/cart/add/{products[0]}', data={'quantity': 2})
+    client.post(f'/cart/add/{products[1]}')
+
+    # The user already had one of those products in their account cart
+    with app.app_context():
+        db.session.add(CartItem(session_id=f'u:{user_id}', product_id=products[0], quantity=1))
+        db.session.commit()
+
+    login(client)
+    assert cart_rows(app) == {
+        (f'u:{user_id}', products[0]): 3,
+        (f'u:{user_id}', products[1]): 1,
+    }
+
+
+def test_cart_page_totals(client, products):
+    # Products are priced 1.50, 2.50, ...
+    client.post(f'/cart/add/{products[0]}', data={'quantity': 2})
+    client.post(f'/cart/add/{products[1]}', data={'quantity': 1})
+
+    page = client.get('/cart').get_data(as_text=True)
+    assert '5.50' in page
@@ -0,0 +1,58 @@
+from conftest import count_queries, make_user, login
+from app import db, Order, Product
+
+
+def checkout(client, *lines):
+    for product_id, quantity in lines:
+        client.post(f'/cart/add/{product_id}', data={'quantity': quantity})
+    return client.post('/checkout', data={'shipping_address': '1 Main St'})
+
+
+def test_checkout_stores_order_total_and_clears_cart(app, client, products):
+    make_user()
+    login(client)
+    response = checkout(client, (products[0], 2), (products[1], 1))
+    assert response.location.endswith('/order/1')
+
+    with app.app_context():
+        order = db.session.get(Order, 1)
+        assert order.total_amount == 5.50
+        assert order.calculate_total() == 5.50
+        assert len(order.items) == 2
+    assert client.get('/cart').get_data(as_text=True).count('class="cart-item"') == 0
+
+
+def test_order_total_survives_later_changes(app, client, products):
+    make_user('admin', is_admin=True)
+    login(client, 'admin')
+    checkout(client, (products[0], 2))
+
+    client.post(f'/admin/products/delete/{products[0]}')
+    with app.app_context():
+        assert db.session.get(Product, products[0]) is None
+        assert db.session.get(Order, 1).total_amount == 3.00
+
+
+def test_orders_are_private(app, client, products):
+    make_user()
+    make_user('bob')
+    login(client)
+    checkout(client, (products[0], 1))
+    client.get('/logout')
+
+    login(client, 'bob')
+    response = client.get('/order/1')
+    assert response.status_code == 302
+
+
+def test_order_timestamps_are_sent_with_the_insert(app, client, products):
+    # Tables created before the server defaults existed have no column DEFAULT
+    make_user()
+    login(client)
+    with count_queries() as queries:
+        checkout(client, (products[0], 1))
+    order_insert = next(q for q in queries if q.startswith('INSERT INTO orders'))
+    assert 'order_date' in order_insert and 'created_at' in order_insert
+
+    with app.app_context():
+        assert db.session.get(Order, 1).order_date is not None
@@ -0,0 +1,37 @@
+import pytest
+
+from app import db, Product, PRODUCTS_PER_PAGE
+
+
+@pytest.fixture
+def many_products(app):
+    with app.app_context():
+        db.session.add_all([
+            Product(name=f'Apple {n}', category='fruit', description='Crisp', price=1.00, stock=10,
+                    is_available=True)
+            for n in range(PRODUCTS_PER_PAGE + 6)
+        ])
+        db.session.commit()
+
+
+def test_page_links_keep_the_filters(client, many_products):
+    page = client.get('/products?category=fruit').get_data(as_text=True)
+    assert '/products?page=2&amp;category=fruit' in page
+
+    page = client.get('/products?search=apple').get_data(as_text=True)
+    assert '/products?page=2&amp;search=apple' in page
+
+
+@pytest.mark.parametrize('query', [
+    'endpoint=x',
+    '_method=POST',
+    '_external=1&_anchor=evil',
+    '_scheme=javascript',
+])
+def test_unrelated_query_arguments_are_not_passed_to_url_for(client, many_products, query):
+    response = client.get(f'/products?{query}')
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert '/products?page=2"' in page
+    assert 'evil' not in page
+    assert 'http://localhost' not in page
@@ -0,0 +1,81 @@
+"""Query-count guards against N+1 regressions on the main pages"""
+from conftest import count_queries, make_user, login
+
+
+def place_order(client, product_id, quantity=2):
+    client.post(f'/cart/add/{product_id}', data={'quantity': quantity})
+    return client.post('/checkout', data={'shipping_address': '1 Main St'})
+
+
+def warm_get(client, url):
+    """Request a page twice and count the queries of the second, cache-warm request"""
+    client.get(url)
+    with count_queries() as queries:
+        response = client.get(url)
+    assert response.status_code == 200
+    return queries
+
+
+def test_home(client, products):
+    assert len(warm_get(client, '/')) <= 1
+
+
+def test_catalog(client, products):
+    # Page count + page rows; categories come from the cache
+    assert len(warm_get(client, '/products')) <= 2
+    assert len(warm_get(client, '/products?category=fruit')) <= 2
+    assert len(warm_get(client, '/products?search=fruit')) <= 2
+
+
+def test_product_detail(client, products):
+    # The product itself is served from the row cache; only related products hit the DB
+    assert len(warm_get(client, f'/product/{products[0]}')) <= 1
+
+
+def test_cart(client, products):
+    for product_id in products:
+        client.post(f'/cart/add/{product_id}')
+    # Cart rows + their products; totals and the navbar badge reuse the loaded rows
+    assert len(warm_get(client, '/cart')) <= 2
+
+
+def test_order_history_is_constant(client, products):
+    make_user()
+    login(client)
+    place_order(client, products[0])
+    # Orders, their items, their products, plus the navbar cart badge
+    single = warm_get(client, '/orders')
+    assert len(single) <= 4
+
+    for product_id in products[1:]:
+        place_order(client, product_id)
+    assert len(warm_get(client, '/orders')) == len(single)
+
+
+def test_order_confirmation(client, products):
+    make_user()
+    login(client)
+    place_order(client, products[0])
+    place_order(client, products[1])
+    assert len(warm_get(client, '/order/1')) <= 4
+
+
+def test_admin_orders_is_constant(client, products):
+    make_user('admin', is_admin=True)
+    login(client, 'admin')
+    place_order(client, products[0])
+    # Page count + orders, their users and items, plus the navbar cart badge
+    single = warm_get(client, '/admin/orders')
+    assert len(single) <= 5
+
+    for product_id in products[1:]:
+        place_order(client, product_id)
+    assert len(warm_get(client, '/admin/orders')) == len(single)
+
+
+def test_add_to_cart_uses_the_cached_product(client, products):
+    client.get(f'/product/{products[0]}')
+    with count_queries() as queries:
+        client.post(f'/cart/add/{products[0]}')
+    # Just the cart upsert; the product comes from the row cache
+    assert len(queries) == 1
@@ -0,0 +1,19 @@
+def test_login_attempts_are_limited(client):
+    for _ in range(5):
+        assert client.post('/login', data={'username': 'alice', 'password': 'wrong'}).status_code == 200
+
+    response = client.post('/login', data={'username': 'alice', 'password': 'wrong'},
+                           headers={'Referer': 'https://evil.example/'})
+    assert response.status_code == 429
+    assert 'Retry-After' in response.headers
+    assert 'Too many attempts' in response.get_data(as_text=True)
+
+
+def test_add_to_cart_is_limited(client, products):
+    for _ in range(30):
+        client.post(f'/cart/add/{products[0]}')
+
+    response = client.post(f'/cart/add/{products[0]}', headers={'Referer': 'https://evil.example/'})
+    assert response.status_code == 429
+    assert 'Retry-After' in response.headers
+    assert response.location is None
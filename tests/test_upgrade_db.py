@@ -0,0 +1,73 @@
+"""flask upgrade-db against a database created by the original schema"""
+from conftest import make_user, login
+from app import db, CartItem, Order
+
+LEGACY_SCHEMA = [
+    'DROP TABLE IF EXISTS order_items', 'DROP TABLE IF EXISTS orders',
+    'DROP TABLE IF EXISTS cart_items', 'DROP TABLE IF EXISTS products', 'DROP TABLE IF EXISTS users',
+    '''CREATE TABLE users (
+        id INTEGER PRIMARY KEY, username VARCHAR(100) NOT NULL, email VARCHAR(120) NOT NULL,
+        password_hash VARCHAR(255) NOT NULL, first_name VARCHAR(100), last_name VARCHAR(100),
+        created_at DATETIME, updated_at DATETIME, is_admin BOOLEAN)''',
+    'CREATE UNIQUE INDEX ix_users_username ON users (username)',
+    'CREATE UNIQUE INDEX ix_users_email ON users (email)',
+    '''CREATE TABLE products (
+        id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, description TEXT,
+        category VARCHAR(50) NOT NULL, price FLOAT NOT NULL, stock INTEGER, image_url VARCHAR(255),
+        created_at DATETIME, updated_at DATETIME, is_available BOOLEAN)''',
+    'CREATE INDEX ix_products_name ON products (name)',
+    'CREATE INDEX ix_products_category ON products (category)',
+    '''CREATE TABLE cart_items (
+        id INTEGER PRIMARY KEY, session_id VARCHAR(255) NOT NULL,
+        product_id INTEGER NOT NULL REFERENCES products (id), quantity INTEGER, added_at DATETIME)''',
+    'CREATE INDEX ix_cart_items_session_id ON cart_items (session_id)',
+    '''CREATE TABLE orders (
+        id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users (id), order_date DATETIME,
+        total_amount FLOAT NOT NULL, status VARCHAR(50), shipping_address TEXT NOT NULL, notes TEXT,
+        created_at DATETIME, updated_at DATETIME)''',
+    'CREATE INDEX ix_orders_order_date ON orders (order_date)',
+    '''CREATE TABLE order_items (
+        id INTEGER PRIMARY KEY, order_id INTEGER NOT NULL REFERENCES orders (id),
+        product_id INTEGER NOT NULL REFERENCES products (id), quantity INTEGER NOT NULL,
+        price FLOAT NOT NULL)''',
+]
+
+
+def test_upgrade_legacy_database(app, client):
+    with app.app_context():
+        with db.engine.begin() as conn:
+            for statement in LEGACY_SCHEMA:
+                conn.execute(db.text(statement))
+            conn.execute(db.text(
+                "INSERT INTO products (id, name, category, price, stock, is_available) "
+                "VALUES (1, 'Apple', 'fruit', 1.5, 50, 1)"
+            ))
+            conn.execute(db.text(
+                "INSERT INTO cart_items (session_id, product_id, quantity) "
+                "VALUES ('u:1', 1, 1), ('u:1', 1, 2)"
+            ))
+
+    result = app.test_cli_runner().invoke(args=['upgrade-db'])
+    assert result.exit_code == 0, result.output
+    assert 'Added order_items.subtotal.' in result.output
+    assert 'Created index ix_cart_session_product.' in result.output
+
+    with app.app_context():
+        indexes = {i['name'] for i in db.inspect(db.engine).get_indexes('cart_items')}
+        assert indexes == {'ix_cart_session_product'}
+        assert [(c.product_id, c.quantity) for c in CartItem.query.all()] == [(1, 3)]
+
+    # Running it again changes nothing
+    result = app.test_cli_runner().invoke(args=['upgrade-db'])
+    assert result.output.strip() == 'Database upgraded.'
+
+    # The merged cart checks out against the upgraded schema
+    make_user()
+    login(client)
+    client.post('/checkout', data={'shipping_address': '1 Main St'})
+    with app.app_context():
+        order = db.session.get(Order, 1)
+        assert order.total_amount == 4.50
+        assert order.items[0].subtotal == 4.50
+        assert order.order_date is not None
+    assert client.get('/orders').status_code == 200